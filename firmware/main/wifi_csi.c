@@ -30,6 +30,10 @@
 #include <string.h>
 #include <math.h>
 
+#if CONFIG_CSI_PACKED_OUTPUT
+#include "mbedtls/base64.h"
+#endif
+
 static const char *TAG = "wifi_csi";
 
 // CSI configuration
@@ -45,6 +49,14 @@ static wifi_csi_config_t csi_config = {
     .dump_ack_en = false,      // Don't dump ACK frames
 };
 
+#if CONFIG_CSI_PACKED_OUTPUT
+// Quantization steps for packed output. Amplitude (max ~181) in 0.01 steps
+// and phase ([-pi, pi]) in 0.0001 rad steps both fit in int16 and match the
+// resolution of the "%.2f" / "%.4f" text output.
+#define CSI_AMP_SCALE   0.01f
+#define CSI_PHASE_SCALE 0.0001f
+#endif
+
 // State variables
 static bool s_csi_active = false;
 static csi_data_t s_latest_csi;
@@ -92,6 +104,33 @@ static void process_csi_data(const int8_t *raw_buf, uint16_t len, csi_data_t *ou
     }
 }
 
+#if CONFIG_CSI_PACKED_OUTPUT
+/**
+ * @brief Quantize values to int16 and base64-encode them
+ *
+ * The ESP32 is little-endian, so the int16 array is encoded as-is and the
+ * host decodes it as little-endian int16.
+ *
+ * @param values Values to encode
+ * @param n Number of values (at most 64)
+ * @param scale Quantization step (value = int16 * scale)
+ * @param out Output buffer for the NUL-terminated base64 string
+ * @param out_len Size of out (at least 173 bytes for 64 values)
+ */
+static void encode_packed(const float *values, int n, float scale,
+                          char *out, size_t out_len)
+{
+    int16_t q[64];
+    size_t olen;
+
+    for (int i = 0; i < n; i++) {
+        q[i] = (int16_t)lroundf(values[i] / scale);
+    }
+    mbedtls_base64_encode((unsigned char *)out, out_len, &olen,
+                          (const unsigned char *)q, n * sizeof(int16_t));
+}
+#endif
+
 /**
  * @brief WiFi CSI receive callback
  *
@@ -132,6 +171,22 @@ static void wifi_csi_rx_cb(void *ctx, wifi_csi_info_t *info)
 
     // Stream CSI data over serial in JSON format
     // This allows real-time visualization and analysis on the laptop
+#if CONFIG_CSI_PACKED_OUTPUT
+    // Format: {"ts":12345,"rssi":-45,"num":64,"scale":0.01,"amp_q":"<base64>",
+    //          "phase_scale":0.0001,"phase_q":"<base64>"}
+    // 64 int16 values = 128 bytes -> 172 base64 characters + NUL
+    char amp_b64[176];
+    char phase_b64[176];
+    encode_packed(processed.amplitude, processed.num_subcarriers, CSI_AMP_SCALE,
+                  amp_b64, sizeof(amp_b64));
+    encode_packed(processed.phase, processed.num_subcarriers, CSI_PHASE_SCALE,
+                  phase_b64, sizeof(phase_b64));
+    printf("{\"ts\":%lu,\"rssi\":%d,\"num\":%d,"
+           "\"scale\":%g,\"amp_q\":\"%s\","
+           "\"phase_scale\":%g,\"phase_q\":\"%s\"}\n",
+           processed.timestamp, processed.rssi, processed.num_subcarriers,
+           CSI_AMP_SCALE, amp_b64, CSI_PHASE_SCALE, phase_b64);
+#else
     // Format: {"ts":12345,"rssi":-45,"num":64,"amp":[...],"phase":[...]}
     printf("{\"ts\":%lu,\"rssi\":%d,\"num\":%d,\"amp\":[",
            processed.timestamp, processed.rssi, processed.num_subcarriers);
@@ -147,6 +202,7 @@ static void wifi_csi_rx_cb(void *ctx, wifi_csi_info_t *info)
                (i < processed.num_subcarriers - 1) ? "," : "");
     }
     printf("]}\n");
+#endif
 
     // Log occasionally for debugging (every 100 packets)
     if (s_packets_received % 100 == 0) {
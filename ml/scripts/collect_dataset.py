@@ -18,7 +18,10 @@ Usage:
 
 import sys
 import os
+import time
+import atexit
 import json
+import orjson
 import serial
 import argparse
 import numpy as np
@@ -27,7 +30,16 @@ from pathlib import Path
 
 # Add parent tools directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'tools'))
-from csi_analyzer import CSIAnalyzer
+from csi_analyzer import CSIAnalyzer, is_csi_packet
+from serial_reader import SerialLineReader
+
+# Output files are buffered and flushed in batches rather than per packet.
+# A crash loses at most one buffer or one flush interval of data.
+WRITE_BUFFER_SIZE = 65536   # bytes
+FLUSH_INTERVAL = 0.5        # seconds
+
+# Progress line refresh period (console output is rate-limited to ~10 Hz)
+PRINT_INTERVAL_NS = 100_000_000
 
 
 class DatasetCollector:
@@ -45,6 +57,10 @@ class DatasetCollector:
         'custom': 'Custom activity (specify description)'
     }
 
+    # Minimum seconds between metadata.json rewrites; pending changes are
+    # always written at exit
+    METADATA_SAVE_INTERVAL = 2.0
+
     def __init__(self, output_dir='ml/datasets'):
         """
         Initialize dataset collector
@@ -59,6 +75,11 @@ class DatasetCollector:
         self.metadata_file = self.output_dir / 'metadata.json'
         self.metadata = self.load_metadata()
 
+        # Coalesced metadata writes (see save_metadata)
+        self._dirty = False
+        self._last_save = None
+        atexit.register(self.save_metadata, force=True)
+
     def load_metadata(self):
         """Load or create dataset metadata"""
         if self.metadata_file.exists():
@@ -76,12 +97,32 @@ class DatasetCollector:
                 }
             }
 
-    def save_metadata(self):
-        """Save dataset metadata"""
+    def save_metadata(self, force=False):
+        """
+        Save dataset metadata if it has unsaved changes
+
+        Writes are coalesced to at most one per METADATA_SAVE_INTERVAL
+        seconds, so scripted runs with many short samples don't rewrite
+        the whole file for every sample.
+
+        Args:
+            force: Write pending changes regardless of the interval
+        """
+        if not self._dirty:
+            return
+
+        now = time.monotonic()
+        if (not force and self._last_save is not None
+                and now - self._last_save < self.METADATA_SAVE_INTERVAL):
+            return
+
         self.metadata['updated'] = datetime.now().isoformat()
         with open(self.metadata_file, 'w') as f:
             json.dump(self.metadata, f, indent=2)
 
+        self._dirty = False
+        self._last_save = now
+
     def create_sample(self, activity, description='', trial_num=1):
         """
         Create a new sample collection session
@@ -129,6 +170,7 @@ class DatasetCollector:
             'timestamp': timestamp,
         })
         self.metadata['total_samples'] += 1
+        self._dirty = True
         self.save_metadata()
 
         return sample_dir
@@ -159,7 +201,8 @@ class DatasetCollector:
         print("="*60 + "\n")
 
 
-def collect_csi_data(port, sample_dir, duration, activity, trial_num, baud=115200):
+def collect_csi_data(port, sample_dir, duration, activity, trial_num, baud=115200,
+                     save_raw=False):
     """
     Collect CSI data for specified duration
 
@@ -170,6 +213,7 @@ def collect_csi_data(port, sample_dir, duration, activity, trial_num, baud=11520
         activity: Activity name
         trial_num: Trial number
         baud: Baud rate
+        save_raw: Also save raw CSI packets (amp/phase arrays) to raw_csi.jsonl
     """
     # Open serial port
     try:
@@ -181,12 +225,13 @@ def collect_csi_data(port, sample_dir, duration, activity, trial_num, baud=11520
     # Initialize analyzer
     analyzer = CSIAnalyzer(window_size=10, movement_threshold=5.0)
 
-    # Open output files
+    # Open output files (raw packets are several times larger than the
+    # features and only written on request)
     features_file = sample_dir / 'features.jsonl'
     raw_file = sample_dir / 'raw_csi.jsonl'
 
-    features_out = open(features_file, 'w')
-    raw_out = open(raw_file, 'w')
+    features_out = open(features_file, 'wb', buffering=WRITE_BUFFER_SIZE)
+    raw_out = open(raw_file, 'wb', buffering=WRITE_BUFFER_SIZE) if save_raw else None
 
     print(f"\n{'='*60}")
     print(f"COLLECTING DATA")
@@ -199,27 +244,35 @@ def collect_csi_data(port, sample_dir, duration, activity, trial_num, baud=11520
     print("Data collection will start in:")
     for i in range(3, 0, -1):
         print(f"  {i}...")
-        import time
         time.sleep(1)
     print("  START!\n")
 
-    start_time = datetime.now()
+    # Monotonic integer clock for elapsed time; wall clock only for display
+    start_ns = time.monotonic_ns()
+    duration_ns = int(duration * 1_000_000_000)
     packet_count = 0
+    last_flush = time.monotonic()
+    last_print_ns = 0
+
+    # Read the serial port on a background thread so UART input keeps
+    # flowing while packets are parsed and written
+    reader = SerialLineReader(ser)
+    reader.start()
 
     try:
-        while (datetime.now() - start_time).total_seconds() < duration:
-            line = ser.readline().decode('utf-8', errors='ignore').strip()
+        while time.monotonic_ns() - start_ns < duration_ns:
+            line = reader.get_line(timeout=1)
 
             # Skip empty lines and ESP-IDF log lines
-            if not line or not line.startswith('{'):
+            if not line or not line.startswith(b'{'):
                 continue
 
             try:
-                # Parse JSON
-                data = json.loads(line)
+                # Parse JSON (orjson accepts bytes, no decode needed)
+                data = orjson.loads(line)
 
                 # Validate expected fields
-                if 'ts' not in data or 'rssi' not in data or 'amp' not in data:
+                if not is_csi_packet(data):
                     continue
 
                 packet_count += 1
@@ -231,34 +284,48 @@ def collect_csi_data(port, sample_dir, duration, activity, trial_num, baud=11520
                 features['label'] = activity
                 features['trial_num'] = trial_num
 
-                # Display progress
-                elapsed = (datetime.now() - start_time).total_seconds()
-                remaining = duration - elapsed
-                now = datetime.now().strftime('%H:%M:%S')
-                print(f"[{now}] {packet_count:4d} packets | "
-                      f"Elapsed: {elapsed:5.1f}s | Remaining: {remaining:5.1f}s | "
-                      f"RSSI: {features['rssi']:3d}dBm", end='\r')
+                # Display progress (rate-limited)
+                now_ns = time.monotonic_ns()
+                if now_ns - last_print_ns >= PRINT_INTERVAL_NS:
+                    last_print_ns = now_ns
+                    elapsed = (now_ns - start_ns) * 1e-9
+                    remaining = duration - elapsed
+                    now = time.strftime('%H:%M:%S')
+                    print(f"[{now}] {packet_count:4d} packets | "
+                          f"Elapsed: {elapsed:5.1f}s | Remaining: {remaining:5.1f}s | "
+                          f"RSSI: {features['rssi']:3d}dBm", end='\r')
 
                 # Save data
-                features_out.write(json.dumps(features) + '\n')
-                features_out.flush()
-
-                raw_out.write(json.dumps(data) + '\n')
-                raw_out.flush()
-
-            except json.JSONDecodeError:
+                features_out.write(orjson.dumps(features, option=orjson.OPT_SERIALIZE_NUMPY) + b'\n')
+                if raw_out:
+                    raw_out.write(orjson.dumps(data) + b'\n')
+
+                # Full buffers flush themselves; also flush on a timer so the
+                # files on disk never lag far behind the live session
+                now_mono = time.monotonic()
+                if now_mono - last_flush > FLUSH_INTERVAL:
+                    features_out.flush()
+                    if raw_out:
+                        raw_out.flush()
+                    last_flush = now_mono
+
+            except (orjson.JSONDecodeError, ValueError):
+                # Not valid JSON or malformed CSI packet, skip
                 pass
 
     except KeyboardInterrupt:
         print("\n\nCollection interrupted by user")
 
     finally:
+        reader.stop()
         ser.close()
+        # close() flushes whatever is still buffered
         features_out.close()
-        raw_out.close()
+        if raw_out:
+            raw_out.close()
 
         # Print summary
-        elapsed = (datetime.now() - start_time).total_seconds()
+        elapsed = (time.monotonic_ns() - start_ns) * 1e-9
         print(f"\n\n{'='*60}")
         print("COLLECTION COMPLETE")
         print(f"{'='*60}")
@@ -266,7 +333,8 @@ def collect_csi_data(port, sample_dir, duration, activity, trial_num, baud=11520
         print(f"Packets collected: {packet_count}")
         print(f"Avg rate: {packet_count/max(elapsed, 1):.1f} packets/sec")
         print(f"Features saved: {features_file}")
-        print(f"Raw CSI saved: {raw_file}")
+        if raw_out:
+            print(f"Raw CSI saved: {raw_file}")
 
         # Get analyzer statistics
         stats = analyzer.get_statistics()
@@ -276,7 +344,7 @@ def collect_csi_data(port, sample_dir, duration, activity, trial_num, baud=11520
         print(f"{'='*60}\n")
 
 
-def interactive_mode(port, output_dir, baud=115200):
+def interactive_mode(port, output_dir, baud=115200, save_raw=False):
     """Interactive data collection mode"""
     collector = DatasetCollector(output_dir)
 
@@ -335,7 +403,7 @@ def interactive_mode(port, output_dir, baud=115200):
         sample_dir = collector.create_sample(activity, description, trial_num)
 
         # Collect data
-        collect_csi_data(port, sample_dir, duration, activity, trial_num, baud)
+        collect_csi_data(port, sample_dir, duration, activity, trial_num, baud, save_raw)
 
         # Ask to continue
         cont = input("\nCollect another sample? (y/n): ").strip().lower()
@@ -368,6 +436,8 @@ Examples:
                        help='Activity to collect (non-interactive mode)')
     parser.add_argument('-d', '--duration', type=int, default=30, help='Collection duration in seconds (default: 30)')
     parser.add_argument('--description', help='Custom activity description')
+    parser.add_argument('--save-raw', action='store_true',
+                       help='Also save raw CSI packets to raw_csi.jsonl')
     args = parser.parse_args()
 
     # Check if tools are available
@@ -383,11 +453,12 @@ Examples:
         collector = DatasetCollector(args.output_dir)
         trial_num = collector.get_next_trial_num(args.activity)
         sample_dir = collector.create_sample(args.activity, args.description or '', trial_num)
-        collect_csi_data(args.port, sample_dir, args.duration, args.activity, trial_num, args.baud)
+        collect_csi_data(args.port, sample_dir, args.duration, args.activity, trial_num,
+                         args.baud, args.save_raw)
         collector.print_dataset_summary()
     else:
         # Interactive mode
-        interactive_mode(args.port, args.output_dir, args.baud)
+        interactive_mode(args.port, args.output_dir, args.baud, args.save_raw)
 
 
 if __name__ == '__main__':
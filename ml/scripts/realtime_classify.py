@@ -9,67 +9,108 @@ Usage:
 """
 
 import sys
-import json
-import pickle
+import time
 import argparse
 from pathlib import Path
-from datetime import datetime
 from collections import deque
 
+import joblib
 import numpy as np
+import orjson
 import serial
 
 # Add tools to path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'tools'))
-from csi_analyzer import CSIAnalyzer
+from csi_analyzer import CSIAnalyzer, is_csi_packet
+from csi_features import compile_feature_extractor
+from serial_reader import SerialLineReader
+
+# Console refresh period: only the latest prediction is shown, ~10 times/s
+PRINT_INTERVAL_NS = 100_000_000
 
 
 class RealtimeClassifier:
     """Real-time activity classification from CSI data"""
 
-    def __init__(self, model_path, window_size=10):
+    def __init__(self, model_path, window_size=10, batch_size=8):
         """
         Initialize classifier
 
         Args:
             model_path: Path to trained model (.pkl)
             window_size: Number of predictions to smooth (majority vote)
+            batch_size: Maximum number of samples classified per model call
         """
-        # Load model
-        with open(model_path, 'rb') as f:
-            model_data = pickle.load(f)
+        # Load model (joblib also reads models saved as plain pickles)
+        model_data = joblib.load(model_path)
 
         self.model = model_data['model']
         self.scaler = model_data['scaler']
         self.feature_names = model_data['feature_names']
         self.classes = model_data['metrics'].get('classes', [])
 
+        # Generated extractor for the model's feature order:
+        # extract_features(csi_features) -> tuple of feature values
+        self.extract_features = compile_feature_extractor(self.feature_names)
+
+        # Inference runs on a handful of rows at a time; spinning up joblib
+        # workers for every call costs far more than the tree traversal
+        if hasattr(self.model, 'n_jobs'):
+            self.model.n_jobs = 1
+        self._predict_proba = self.model.predict_proba
+
+        # Prefer the ONNX graph when the model was exported with --model onnx
+        self.backend = 'scikit-learn'
+        onnx_model = model_data.get('onnx_model')
+        if onnx_model is not None:
+            try:
+                import onnxruntime
+            except ImportError:
+                print("Warning: onnxruntime not installed, using scikit-learn model")
+            else:
+                session = onnxruntime.InferenceSession(
+                    onnx_model, providers=['CPUExecutionProvider'])
+                input_name = session.get_inputs()[0].name
+                proba_name = session.get_outputs()[1].name
+                self._predict_proba = lambda X: session.run([proba_name], {input_name: X})[0]
+                self.backend = 'onnxruntime'
+
+        # Scaler parameters and a reusable input row, so predict() can
+        # standardize features in place instead of calling scaler.transform.
+        # Forest models have the scaler folded into their thresholds at
+        # training time and are saved with scaler=None.
+        self._mean = None
+        self._scale = None
+        if self.scaler is not None:
+            self._mean = self.scaler.mean_.astype(np.float32)
+            self._scale = self.scaler.scale_.astype(np.float32)
+        self._x = np.empty((1, len(self.feature_names)), dtype=np.float32)
+
+        # Pending rows for batched inference (see add_sample/predict_batch)
+        self._batch = np.empty((batch_size, len(self.feature_names)), dtype=np.float32)
+        self._batch_len = 0
+
         # Prediction smoothing
         self.window_size = window_size
         self.prediction_history = deque(maxlen=window_size)
 
+        # Per-class vote counts over prediction_history, updated
+        # incrementally so the majority vote is O(1) per packet
+        self._cls_to_idx = {cls: i for i, cls in enumerate(self.classes)}
+        self._window_counts = np.zeros(len(self.classes), dtype=np.int32)
+
         # Statistics
         self.total_predictions = 0
         self.class_counts = {cls: 0 for cls in self.classes}
 
-    def extract_features(self, csi_features):
-        """Extract feature vector from CSI analyzer output"""
-        return [
-            csi_features.get('rssi', 0),
-            csi_features.get('rssi_mean', 0),
-            csi_features.get('amp_mean', 0),
-            csi_features.get('amp_std', 0),
-            csi_features.get('amp_max', 0),
-            csi_features.get('amp_min', 0),
-            csi_features.get('amp_range', 0),
-            csi_features.get('temporal_variance', 0),
-            csi_features.get('amp_mean_filtered', 0),
-        ]
-
     def predict(self, csi_features):
         """
         Predict activity from CSI features
 
+        The feature row is written into a buffer allocated once in
+        __init__ and scaled in place, so single-packet prediction does
+        not allocate an input array per call.
+
         Args:
             csi_features: Feature dict from CSIAnalyzer
 
@@ -78,33 +119,76 @@ class RealtimeClassifier:
             confidence: Prediction confidence
             smoothed_class: Smoothed prediction (majority vote)
         """
-        # Extract features
-        features = self.extract_features(csi_features)
-        X = np.array([features])
+        # Extract features into the preallocated row
+        X = self._x
+        X[0] = self.extract_features(csi_features)
 
-        # Scale
-        X_scaled = self.scaler.transform(X)
+        return self._classify(X)[0]
 
-        # Predict
-        pred_class = self.model.predict(X_scaled)[0]
-        pred_proba = self.model.predict_proba(X_scaled)[0]
-        confidence = np.max(pred_proba)
+    def add_sample(self, csi_features):
+        """
+        Queue CSI features for the next predict_batch() call
 
-        # Add to history
-        self.prediction_history.append(pred_class)
+        Args:
+            csi_features: Feature dict from CSIAnalyzer
 
-        # Smoothed prediction (majority vote)
-        if len(self.prediction_history) >= self.window_size:
-            smoothed_class = max(set(self.prediction_history),
-                                key=self.prediction_history.count)
-        else:
-            smoothed_class = pred_class
+        Returns:
+            True if the batch is full and should be classified
+        """
+        self._batch[self._batch_len] = self.extract_features(csi_features)
+        self._batch_len += 1
+        return self._batch_len == len(self._batch)
 
-        # Update statistics
-        self.total_predictions += 1
-        self.class_counts[smoothed_class] = self.class_counts.get(smoothed_class, 0) + 1
+    def predict_batch(self):
+        """
+        Classify all queued samples with a single model call
 
-        return pred_class, confidence, smoothed_class
+        Returns:
+            List of (predicted_class, confidence, smoothed_class) tuples,
+            one per queued sample, in arrival order
+        """
+        n = self._batch_len
+        self._batch_len = 0
+        if n == 0:
+            return []
+        return self._classify(self._batch[:n])
+
+    def _classify(self, X):
+        """Scale rows of X in place, classify them and update smoothing"""
+        # Scale in place: (x - mean) / scale
+        if self._mean is not None:
+            np.subtract(X, self._mean, out=X)
+            np.divide(X, self._scale, out=X)
+
+        # Predict (class = argmax of probabilities, as in model.predict)
+        proba = self._predict_proba(X)
+        best = proba.argmax(axis=1)
+        confidences = proba.max(axis=1)
+
+        results = []
+        history = self.prediction_history
+        for cls_idx, confidence in zip(best, confidences):
+            pred_class = self.model.classes_[cls_idx]
+
+            # Add to history, retiring the vote of the evicted prediction
+            if len(history) == self.window_size:
+                self._window_counts[self._cls_to_idx[history[0]]] -= 1
+            history.append(pred_class)
+            self._window_counts[self._cls_to_idx[pred_class]] += 1
+
+            # Smoothed prediction (majority vote)
+            if len(history) >= self.window_size:
+                smoothed_class = self.classes[self._window_counts.argmax()]
+            else:
+                smoothed_class = pred_class
+
+            # Update statistics
+            self.total_predictions += 1
+            self.class_counts[smoothed_class] = self.class_counts.get(smoothed_class, 0) + 1
+
+            results.append((pred_class, confidence, smoothed_class))
+
+        return results
 
     def get_statistics(self):
         """Get classification statistics"""
@@ -120,9 +204,16 @@ def main():
     parser.add_argument('-m', '--model', required=True, help='Path to trained model (.pkl)')
     parser.add_argument('-b', '--baud', type=int, default=115200, help='Baud rate (default: 115200)')
     parser.add_argument('-w', '--window', type=int, default=10, help='Smoothing window size (default: 10)')
+    parser.add_argument('--batch-size', type=int, default=8,
+                        help='Packets classified per model call (default: 8)')
+    parser.add_argument('--batch-ms', type=float, default=100,
+                        help='Maximum time a packet waits for its batch in ms (default: 100)')
     parser.add_argument('-v', '--verbose', action='store_true', help='Show detailed predictions')
     args = parser.parse_args()
 
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+
     # Check model file
     if not Path(args.model).exists():
         print(f"Error: Model file not found: {args.model}")
@@ -131,10 +222,13 @@ def main():
     # Initialize classifier
     print("Loading model...")
     try:
-        classifier = RealtimeClassifier(args.model, window_size=args.window)
+        classifier = RealtimeClassifier(args.model, window_size=args.window,
+                                        batch_size=args.batch_size)
         print(f"✓ Model loaded: {args.model}")
+        print(f"✓ Backend: {classifier.backend}")
         print(f"✓ Classes: {', '.join(classifier.classes)}")
         print(f"✓ Smoothing window: {args.window} predictions")
+        print(f"✓ Batching: up to {args.batch_size} packets / {args.batch_ms:g} ms")
         print()
     except Exception as e:
         print(f"Error loading model: {e}")
@@ -156,46 +250,81 @@ def main():
         print(f"Error opening serial port: {e}")
         sys.exit(1)
 
+    # Packets queued in the classifier, classified together once the batch
+    # is full or the oldest one has waited batch_ms
+    pending = []
+    batch_started = 0.0
+    max_wait = args.batch_ms / 1000.0
+    last_print_ns = 0
+
+    # Read the serial port on a background thread so UART input keeps
+    # flowing while a batch is being classified
+    reader = SerialLineReader(ser)
+    reader.start()
+
     try:
         while True:
-            line = ser.readline().decode('utf-8', errors='ignore').strip()
+            if pending and (len(pending) >= args.batch_size or
+                            time.monotonic() - batch_started >= max_wait):
+                # Classify
+                results = classifier.predict_batch()
+
+                # Display the most recent prediction (rate-limited)
+                now_ns = time.monotonic_ns()
+                if now_ns - last_print_ns >= PRINT_INTERVAL_NS:
+                    last_print_ns = now_ns
+                    csi_features = pending[-1]
+                    pred, confidence, smoothed = results[-1]
+
+                    t = time.time()
+                    now = f"{time.strftime('%H:%M:%S', time.localtime(t))}.{int(t * 1000) % 1000:03d}"
+
+                    # Confidence bar
+                    bar_length = 20
+                    filled = int(confidence * bar_length)
+                    conf_bar = '█' * filled + '░' * (bar_length - filled)
+
+                    print(f"[{now}] Activity: {smoothed:12s} | "
+                          f"Confidence: {conf_bar} {confidence*100:5.1f}% | "
+                          f"RSSI: {csi_features['rssi']:3d}dBm", end='')
+
+                    if args.verbose:
+                        print(f" | Raw: {pred}")
+                    else:
+                        print()
+
+                pending.clear()
+
+            # Wait no longer than the open batch's deadline
+            if pending:
+                timeout = max(0.0, batch_started + max_wait - time.monotonic())
+            else:
+                timeout = max_wait
+            line = reader.get_line(timeout=timeout)
 
             # Skip empty lines and ESP-IDF log lines
-            if not line or not line.startswith('{'):
+            if not line or not line.startswith(b'{'):
                 continue
 
             try:
-                # Parse JSON
-                data = json.loads(line)
+                # Parse JSON (orjson accepts bytes, no decode needed)
+                data = orjson.loads(line)
 
                 # Validate expected fields
-                if 'ts' not in data or 'rssi' not in data or 'amp' not in data:
+                if not is_csi_packet(data):
                     continue
 
                 # Process with analyzer
                 csi_features = analyzer.process_packet(data)
 
-                # Classify
-                pred, confidence, smoothed = classifier.predict(csi_features)
-
-                # Display
-                now = datetime.now().strftime('%H:%M:%S.%f')[:-3]
-
-                # Confidence bar
-                bar_length = 20
-                filled = int(confidence * bar_length)
-                conf_bar = '█' * filled + '░' * (bar_length - filled)
-
-                print(f"[{now}] Activity: {smoothed:12s} | "
-                      f"Confidence: {conf_bar} {confidence*100:5.1f}% | "
-                      f"RSSI: {csi_features['rssi']:3d}dBm", end='')
-
-                if args.verbose:
-                    print(f" | Raw: {pred}")
-                else:
-                    print()
+                # Queue for batched classification
+                if not pending:
+                    batch_started = time.monotonic()
+                pending.append(csi_features)
+                classifier.add_sample(csi_features)
 
-            except json.JSONDecodeError:
+            except (orjson.JSONDecodeError, ValueError):
+                # Not valid JSON or malformed CSI packet, skip
                 pass
 
     except KeyboardInterrupt:
@@ -212,6 +341,7 @@ def main():
         print("\nExiting...")
 
     finally:
+        reader.stop()
         ser.close()
 
 
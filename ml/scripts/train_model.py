@@ -14,21 +14,98 @@ Usage:
 
     # Save model
     python3 train_model.py --dataset ml/datasets --output ml/models/rf_model.pkl
+
+    # Train a gradient boosting model, or a forest exported to ONNX
+    python3 train_model.py --dataset ml/datasets --model hgb
+    python3 train_model.py --dataset ml/datasets --model onnx
 """
 
+import os
 import sys
+import mmap
 import json
 import argparse
-import pickle
 from pathlib import Path
 from collections import defaultdict, Counter
 
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier
+import orjson
+import joblib
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestClassifier, HistGradientBoostingClassifier
+from sklearn.inspection import permutation_importance
 from sklearn.model_selection import train_test_split, cross_val_score
 from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
 from sklearn.preprocessing import StandardScaler
 
+# Add tools to path
+sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'tools'))
+from csi_features import FEATURE_NAMES, compile_feature_extractor
+
+# Model types selectable with --model
+MODEL_TYPES = {
+    'rf': 'Random Forest',
+    'hgb': 'Histogram Gradient Boosting',
+    'onnx': 'Random Forest (ONNX export)',
+}
+
+
+# Generated dict -> feature tuple extractor
+_extract_feature_vector = compile_feature_extractor(FEATURE_NAMES)
+
+
+def _grow(arr, capacity):
+    """Return a copy of arr resized along the first axis to capacity"""
+    grown = np.empty((capacity,) + arr.shape[1:], dtype=arr.dtype)
+    grown[:len(arr)] = arr
+    return grown
+
+
+def _load_feature_file(features_file, activity):
+    """
+    Parse one features.jsonl file
+
+    Module-level so joblib can run it in worker processes.
+
+    Args:
+        features_file: Path to features.jsonl
+        activity: Label used for rows without a 'label' field
+
+    Returns:
+        X: float32 feature matrix (n_rows, n_features)
+        y: Label array (n_rows,)
+    """
+    # Preallocated arrays, grown geometrically as rows arrive
+    capacity = 4096
+    X = np.empty((capacity, len(FEATURE_NAMES)), dtype=np.float32)
+    y = np.empty(capacity, dtype=object)
+    n = 0
+
+    with open(features_file, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return X[:0], y[:0]
+
+        # Map the file and walk it line by line as raw bytes; orjson parses
+        # each slice directly, with no text-layer decoding or buffering
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b''):
+                if not line.strip():
+                    continue
+                data = orjson.loads(line)
+
+                if n == capacity:
+                    capacity *= 2
+                    X = _grow(X, capacity)
+                    y = _grow(y, capacity)
+
+                # Fill feature row in place
+                X[n] = _extract_feature_vector(data)
+                y[n] = data.get('label', activity)
+                n += 1
+
+    # Trim to the rows actually loaded
+    return X[:n], y[:n]
+
 
 class CSIDatasetLoader:
     """Load and prepare CSI dataset for training"""
@@ -52,20 +129,21 @@ class CSIDatasetLoader:
         with open(metadata_file, 'r') as f:
             self.metadata = json.load(f)
 
-    def load_features(self):
+    def load_features(self, n_jobs=-1):
         """
         Load all features from dataset
 
+        Args:
+            n_jobs: Worker processes used to parse sample files (-1 = all cores)
+
         Returns:
             X: Feature matrix (n_samples, n_features)
             y: Labels (n_samples,)
             feature_names: List of feature names
         """
-        all_features = []
-        all_labels = []
-
         print("Loading dataset...")
 
+        tasks = []
         for activity, info in self.metadata['activities'].items():
             print(f"  Loading {activity}...")
 
@@ -77,28 +155,21 @@ class CSIDatasetLoader:
                     print(f"    Warning: {features_file} not found, skipping")
                     continue
 
-                # Load features from this sample
-                with open(features_file, 'r') as f:
-                    for line in f:
-                        data = json.loads(line.strip())
-
-                        # Extract feature vector
-                        features = self._extract_feature_vector(data)
-                        label = data.get('label', activity)
+                tasks.append((features_file, activity))
 
-                        all_features.append(features)
-                        all_labels.append(label)
+        # Parse sample files in parallel, one task per file
+        parts = Parallel(n_jobs=n_jobs)(
+            delayed(_load_feature_file)(path, activity) for path, activity in tasks
+        )
 
-        # Convert to numpy arrays
-        X = np.array(all_features)
-        y = np.array(all_labels)
+        if parts:
+            X = np.concatenate([part[0] for part in parts])
+            y = np.concatenate([part[1] for part in parts])
+        else:
+            X = np.empty((0, len(FEATURE_NAMES)), dtype=np.float32)
+            y = np.empty(0, dtype=object)
 
-        # Feature names
-        feature_names = [
-            'rssi', 'rssi_mean', 'amp_mean', 'amp_std',
-            'amp_max', 'amp_min', 'amp_range',
-            'temporal_variance', 'amp_mean_filtered'
-        ]
+        feature_names = list(FEATURE_NAMES)
 
         print(f"\nDataset loaded:")
         print(f"  Total samples: {len(X)}")
@@ -108,29 +179,50 @@ class CSIDatasetLoader:
 
         return X, y, feature_names
 
-    def _extract_feature_vector(self, data):
-        """Extract feature vector from data dict"""
-        return [
-            data.get('rssi', 0),
-            data.get('rssi_mean', 0),
-            data.get('amp_mean', 0),
-            data.get('amp_std', 0),
-            data.get('amp_max', 0),
-            data.get('amp_min', 0),
-            data.get('amp_range', 0),
-            data.get('temporal_variance', 0),
-            data.get('amp_mean_filtered', 0),
-        ]
-
-
-def train_random_forest(X_train, y_train, X_test, y_test, feature_names):
+
+def build_classifier(model_type):
     """
-    Train Random Forest classifier
+    Create an untrained classifier
+
+    Args:
+        model_type: Key of MODEL_TYPES
+
+    Returns:
+        Unfitted scikit-learn classifier
+    """
+    if model_type == 'hgb':
+        # Far fewer node visits per sample than a 100-tree forest
+        return HistGradientBoostingClassifier(
+            max_iter=100,
+            max_depth=6,
+            learning_rate=0.1,
+            random_state=42
+        )
+
+    # 'rf' and 'onnx' both train the Random Forest baseline. Each tree is
+    # fit on a half-size bootstrap, reweighted so skewed classes still
+    # count equally, which roughly halves training time.
+    return RandomForestClassifier(
+        n_estimators=100,
+        max_depth=10,
+        min_samples_split=5,
+        min_samples_leaf=2,
+        max_samples=0.5,
+        class_weight='balanced_subsample',
+        random_state=42,
+        n_jobs=-1
+    )
+
+
+def train_classifier(X_train, y_train, X_test, y_test, feature_names, model_type='rf'):
+    """
+    Train activity classifier
 
     Args:
         X_train, y_train: Training data
         X_test, y_test: Test data
         feature_names: Feature names
+        model_type: Key of MODEL_TYPES
 
     Returns:
         model: Trained model
@@ -138,34 +230,33 @@ def train_random_forest(X_train, y_train, X_test, y_test, feature_names):
         metrics: Performance metrics
     """
     print("\n" + "="*60)
-    print("TRAINING RANDOM FOREST CLASSIFIER")
+    print(f"TRAINING {MODEL_TYPES[model_type].upper()} CLASSIFIER")
     print("="*60)
 
-    # Normalize features
-    scaler = StandardScaler()
-    X_train_scaled = scaler.fit_transform(X_train)
+    # Normalize features. Scaler parameters are kept in float32 so training
+    # sees exactly the values RealtimeClassifier computes at inference time.
+    X_train = np.asarray(X_train, dtype=np.float32)
+    X_test = np.asarray(X_test, dtype=np.float32)
+    scaler = StandardScaler().fit(X_train)
+    scaler.mean_ = scaler.mean_.astype(np.float32)
+    scaler.var_ = scaler.var_.astype(np.float32)
+    scaler.scale_ = scaler.scale_.astype(np.float32)
+    X_train_scaled = scaler.transform(X_train)
     X_test_scaled = scaler.transform(X_test)
 
-    # Train Random Forest
+    # Train model
     print("\nTraining model...")
-    rf = RandomForestClassifier(
-        n_estimators=100,
-        max_depth=10,
-        min_samples_split=5,
-        min_samples_leaf=2,
-        random_state=42,
-        n_jobs=-1
-    )
+    model = build_classifier(model_type)
 
-    rf.fit(X_train_scaled, y_train)
+    model.fit(X_train_scaled, y_train)
 
     # Cross-validation
     print("Running 5-fold cross-validation...")
-    cv_scores = cross_val_score(rf, X_train_scaled, y_train, cv=5)
+    cv_scores = cross_val_score(model, X_train_scaled, y_train, cv=5)
     print(f"  CV Accuracy: {cv_scores.mean():.3f} (+/- {cv_scores.std()*2:.3f})")
 
     # Predictions
-    y_pred = rf.predict(X_test_scaled)
+    y_pred = model.predict(X_test_scaled)
 
     # Metrics
     print("\n" + "="*60)
@@ -184,9 +275,13 @@ def train_random_forest(X_train, y_train, X_test, y_test, feature_names):
     for i, cls in enumerate(classes):
         print(f"{cls:12s} | " + "  ".join(f"{cm[i,j]:8d}" for j in range(len(classes))))
 
-    # Feature importance
+    # Feature importance (permutation-based for models without impurity importances)
     print("\nFeature Importance:")
-    importances = rf.feature_importances_
+    importances = getattr(model, 'feature_importances_', None)
+    if importances is None:
+        importances = permutation_importance(
+            model, X_test_scaled, y_test, n_repeats=5, random_state=42
+        ).importances_mean
     indices = np.argsort(importances)[::-1]
     for i in range(len(feature_names)):
         idx = indices[i]
@@ -202,10 +297,117 @@ def train_random_forest(X_train, y_train, X_test, y_test, feature_names):
         'classes': classes,
     }
 
-    return rf, scaler, metrics
+    return model, scaler, metrics
+
+
+def _is_tree_forest(model):
+    """True if model is an ensemble of scikit-learn decision trees"""
+    return hasattr(model, 'estimators_') and all(
+        hasattr(est, 'tree_') for est in model.estimators_)
+
+
+def prune_forest(model):
+    """
+    Collapse splits whose two leaves predict the same class
 
+    Such a split never changes the tree's vote, only the leaf
+    probabilities, so removing it shortens traversal at little cost in
+    accuracy. Children always have higher node ids than their parent,
+    so a single reverse pass also collapses the chains this creates.
 
-def save_model(model, scaler, metrics, feature_names, output_path):
+    Args:
+        model: Fitted forest (modified in place)
+
+    Returns:
+        (collapsed, total): Number of splits removed and splits before
+        pruning, or None if the model is not a forest of decision trees
+    """
+    if not _is_tree_forest(model):
+        return None
+
+    collapsed = 0
+    total = 0
+    for est in model.estimators_:
+        tree = est.tree_
+        left = tree.children_left
+        right = tree.children_right
+        # Tree arrays are writable views into the fitted tree
+        leaf_class = tree.value[:, 0, :].argmax(axis=1)
+        total += int(np.count_nonzero(left >= 0))
+
+        for node in range(tree.node_count - 1, -1, -1):
+            l, r = left[node], right[node]
+            if l < 0 or left[l] >= 0 or left[r] >= 0:
+                continue
+            if leaf_class[l] != leaf_class[r]:
+                continue
+
+            # Turn the split into a leaf; its value already holds the
+            # combined class distribution of both children
+            left[node] = right[node] = -1
+            tree.feature[node] = -2
+            tree.threshold[node] = -2.0
+            collapsed += 1
+
+    return collapsed, total
+
+
+def fold_scaler_into_trees(model, scaler):
+    """
+    Rewrite forest split thresholds so the model accepts unscaled features
+
+    Tree splits are scale-invariant: x_scaled <= t is the same test as
+    x <= t * scale + mean. Folding the StandardScaler into the thresholds
+    removes the scaling step from inference entirely.
+
+    Args:
+        model: Fitted classifier
+        scaler: StandardScaler the model was trained with
+
+    Returns:
+        True if the thresholds were rewritten, False if the model is not
+        a forest of decision trees (the scaler must then be kept)
+    """
+    if not _is_tree_forest(model):
+        return False
+
+    mean = scaler.mean_.astype(np.float64)
+    scale = scaler.scale_.astype(np.float64)
+
+    for est in model.estimators_:
+        tree = est.tree_
+        # Leaves have feature < 0; tree_.threshold is a writable view
+        split = tree.feature >= 0
+        features = tree.feature[split]
+        tree.threshold[split] = tree.threshold[split] * scale[features] + mean[features]
+
+    return True
+
+
+def export_onnx(model, n_features):
+    """
+    Convert a fitted classifier to an ONNX graph
+
+    Args:
+        model: Fitted scikit-learn classifier
+        n_features: Number of input features
+
+    Returns:
+        Serialized ONNX model (bytes)
+    """
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType
+
+    # Plain probability tensor output instead of a list of dicts (zipmap)
+    onnx_model = convert_sklearn(
+        model,
+        initial_types=[('input', FloatTensorType([None, n_features]))],
+        options={id(model): {'zipmap': False}}
+    )
+    return onnx_model.SerializeToString()
+
+
+def save_model(model, scaler, metrics, feature_names, output_path, onnx_model=None):
     """Save trained model and metadata"""
     output_path = Path(output_path)
     output_path.parent.mkdir(parents=True, exist_ok=True)
@@ -215,12 +417,21 @@ def save_model(model, scaler, metrics, feature_names, output_path):
         'scaler': scaler,
         'feature_names': feature_names,
         'metrics': metrics,
-        'model_type': 'RandomForestClassifier',
+        'model_type': type(model).__name__,
         'trained_date': str(np.datetime64('now')),
     }
 
-    with open(output_path, 'wb') as f:
-        pickle.dump(model_data, f)
+    # Serialized ONNX graph used for inference when onnxruntime is available
+    if onnx_model is not None:
+        model_data['onnx_model'] = onnx_model
+
+    # Compressed joblib file: lz4 when installed (fastest to load), else zlib
+    try:
+        import lz4
+        compress = ('lz4', 3)
+    except ImportError:
+        compress = ('zlib', 3)
+    joblib.dump(model_data, output_path, compress=compress)
 
     print(f"\nModel saved to: {output_path}")
 
@@ -244,6 +455,10 @@ def main():
                        help='Output model path (default: ml/models/rf_baseline.pkl)')
     parser.add_argument('--random-seed', type=int, default=42,
                        help='Random seed for reproducibility (default: 42)')
+    parser.add_argument('--prune', action='store_true',
+                       help='Collapse Random Forest splits whose leaves predict the same class')
+    parser.add_argument('--model', choices=list(MODEL_TYPES.keys()), default='rf',
+                       help='Model type: rf, hgb or onnx (Random Forest exported to ONNX) (default: rf)')
     args = parser.parse_args()
 
     # Check dependencies
@@ -254,6 +469,14 @@ def main():
         print("Install with: pip install scikit-learn")
         sys.exit(1)
 
+    if args.model == 'onnx':
+        try:
+            import skl2onnx
+        except ImportError:
+            print("Error: skl2onnx not installed (required for --model onnx)")
+            print("Install with: pip install skl2onnx onnxruntime")
+            sys.exit(1)
+
     # Load dataset
     try:
         loader = CSIDatasetLoader(args.dataset)
@@ -280,12 +503,36 @@ def main():
     print(f"  Test samples: {len(X_test)}")
 
     # Train model
-    model, scaler, metrics = train_random_forest(
-        X_train, y_train, X_test, y_test, feature_names
+    model, scaler, metrics = train_classifier(
+        X_train, y_train, X_test, y_test, feature_names, args.model
     )
 
+    # Prune redundant splits
+    if args.prune:
+        pruned = prune_forest(model)
+        if pruned is None:
+            print("\nWarning: --prune only applies to Random Forest models, skipping")
+        else:
+            collapsed, total = pruned
+            X_test_scaled = scaler.transform(np.asarray(X_test, dtype=np.float32))
+            metrics['test_accuracy_pruned'] = accuracy_score(y_test, model.predict(X_test_scaled))
+            metrics['pruned_splits'] = collapsed
+            print(f"\nPruned {collapsed} of {total} splits "
+                  f"(test accuracy after pruning: {metrics['test_accuracy_pruned']:.3f})")
+
+    # Fold scaling into the tree thresholds so inference can skip it
+    if fold_scaler_into_trees(model, scaler):
+        print("\nFolded feature scaling into tree thresholds")
+        scaler = None
+
+    # Export to ONNX
+    onnx_model = None
+    if args.model == 'onnx':
+        print("\nExporting model to ONNX...")
+        onnx_model = export_onnx(model, len(feature_names))
+
     # Save model
-    save_model(model, scaler, metrics, feature_names, args.output)
+    save_model(model, scaler, metrics, feature_names, args.output, onnx_model)
 
     print("\n" + "="*60)
     print("TRAINING COMPLETE")
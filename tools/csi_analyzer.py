@@ -15,17 +15,77 @@ Usage:
     # Save processed data
     python3 csi_analyzer.py /dev/ttyUSB0 --output processed_csi.json
 
+    # Save raw packets and features together in one file
+    python3 csi_analyzer.py /dev/ttyUSB0 --combined-output session.jsonl
+
     # Real-time movement detection
     python3 csi_analyzer.py /dev/ttyUSB0 --detect-movement
 """
 
 import sys
-import json
+import time
+import base64
+import orjson
 import serial
 import argparse
 import numpy as np
-from datetime import datetime
-from collections import deque
+from serial_reader import SerialLineReader
+
+# Output files are buffered and flushed every FLUSH_EVERY packets or
+# FLUSH_INTERVAL seconds, whichever comes first, instead of per packet
+WRITE_BUFFER_SIZE = 65536
+FLUSH_EVERY = 64
+FLUSH_INTERVAL = 0.5
+
+# Packets between exact recomputations of the running window sums,
+# bounding floating-point drift of the incremental update
+VARIANCE_RESYNC_INTERVAL = 1000
+
+def is_csi_packet(data):
+    """
+    Check that a parsed JSON line is a CSI packet
+
+    Accepts both firmware output formats: amplitudes as a JSON float list
+    ('amp') or packed ('amp_q', see decode_amplitudes()).
+    """
+    return 'ts' in data and 'rssi' in data and ('amp' in data or 'amp_q' in data)
+
+
+def decode_amplitudes(data):
+    """
+    Amplitude vector of a CSI packet
+
+    Firmware built with CONFIG_CSI_PACKED_OUTPUT sends amplitudes as base64
+    little-endian int16 in 'amp_q', with the quantization step in 'scale';
+    otherwise they arrive as a JSON float list in 'amp'.
+
+    Args:
+        data: Parsed CSI packet
+
+    Returns:
+        float64 numpy array of subcarrier amplitudes
+
+    Raises:
+        ValueError: Malformed or empty amplitudes (e.g. a byte lost on the
+            UART corrupting the base64); callers skip the packet, as they
+            do for lines that are not valid JSON
+    """
+    packed = data.get('amp_q')
+    if packed is not None:
+        # binascii.Error (bad base64) is a ValueError subclass
+        raw = base64.b64decode(packed, validate=True)
+        if len(raw) % 2:
+            raise ValueError(f"packed amplitudes have odd length {len(raw)}")
+        # Convert before scaling: a JSON integer scale (e.g. "scale":1)
+        # would otherwise leave the vector as int16
+        amp = np.frombuffer(raw, dtype='<i2').astype(np.float64) * float(data.get('scale', 1.0))
+    else:
+        amp_list = data.get('amp', [])
+        amp = np.fromiter(amp_list, dtype=np.float64, count=len(amp_list))
+
+    if amp.size == 0:
+        raise ValueError("packet has no amplitudes")
+    return amp
 
 
 class CSIAnalyzer:
@@ -42,9 +102,27 @@ class CSIAnalyzer:
         self.window_size = window_size
         self.movement_threshold = movement_threshold
 
-        # Ring buffers for windowed analysis
-        self.amp_history = deque(maxlen=window_size)
-        self.rssi_history = deque(maxlen=window_size)
+        # Amplitude ring buffer, shape (window_size, num_subcarriers).
+        # Allocated on the first packet once the subcarrier count is known;
+        # the oldest row is overwritten in place at _head.
+        self._ring = None
+        self._head = 0
+        self._filled = 0
+
+        # Running totals over the rows in the ring, updated per packet:
+        # per-row sums of squares, per-subcarrier sums, total sum of squares
+        self._row_sumsq = None
+        self._col_sum = None
+        self._sumsq = 0.0
+
+        # Mean amplitude of the previous packet, for the EMA filter
+        self._prev_amp_mean = None
+
+        # Ring buffer for windowed RSSI, with a running sum for the mean
+        self._rssi_ring = [0] * window_size
+        self._rssi_head = 0
+        self._rssi_count = 0
+        self._rssi_sum = 0
 
         # Statistics
         self.packet_count = 0
@@ -55,35 +133,43 @@ class CSIAnalyzer:
         Process a single CSI packet
 
         Args:
-            data: Dict with CSI data (ts, rssi, num, amp, phase)
+            data: Dict with CSI data (ts, rssi, num, amp or amp_q/scale, phase)
 
         Returns:
             Dict with processed features
+
+        Raises:
+            ValueError: Malformed amplitudes (see decode_amplitudes());
+                the analyzer state is left unchanged
         """
+        # Decode first so a malformed packet doesn't touch the analyzer state
+        amp = decode_amplitudes(data)
         self.packet_count += 1
 
         # Extract raw data
         timestamp = data.get('ts', 0)
         rssi = data.get('rssi', 0)
-        amp = np.array(data.get('amp', []))
-        phase = np.array(data.get('phase', []))
+        # Phase is not used by any feature yet, so it is left undecoded
 
-        # Calculate amplitude statistics
-        amp_mean = np.mean(amp)
-        amp_std = np.std(amp)
-        amp_max = np.max(amp)
-        amp_min = np.min(amp)
+        # Amplitude statistics and windowed temporal variance
+        amp_mean, amp_std, amp_min, amp_max, temporal_variance = self._process_amplitudes(amp)
 
-        # Add to history
-        self.amp_history.append(amp)
-        self.rssi_history.append(rssi)
+        # Windowed RSSI mean: swap the oldest value out of the running sum
+        head = self._rssi_head
+        if self._rssi_count == self.window_size:
+            self._rssi_sum -= self._rssi_ring[head]
+        else:
+            self._rssi_count += 1
+        self._rssi_ring[head] = rssi
+        self._rssi_sum += rssi
+        self._rssi_head = (head + 1) % self.window_size
 
         # Calculate windowed features
         features = {
             'timestamp': timestamp,
             'packet_num': self.packet_count,
             'rssi': rssi,
-            'rssi_mean': np.mean(self.rssi_history) if self.rssi_history else rssi,
+            'rssi_mean': self._rssi_sum / self._rssi_count,
             'amp_mean': amp_mean,
             'amp_std': amp_std,
             'amp_max': amp_max,
@@ -92,14 +178,10 @@ class CSIAnalyzer:
         }
 
         # Movement detection (if we have enough history)
-        if len(self.amp_history) >= self.window_size:
-            # Calculate variance across time for each subcarrier
-            amp_array = np.array(self.amp_history)  # shape: (window_size, num_subcarriers)
-            temporal_variance = np.var(amp_array, axis=0)  # variance over time for each subcarrier
-            mean_temporal_variance = np.mean(temporal_variance)
-
-            features['temporal_variance'] = mean_temporal_variance
-            features['movement_detected'] = mean_temporal_variance > self.movement_threshold
+        if temporal_variance is not None:
+            # Mean over subcarriers of the amplitude variance across time
+            features['temporal_variance'] = temporal_variance
+            features['movement_detected'] = temporal_variance > self.movement_threshold
 
             if features['movement_detected']:
                 self.movement_detected_count += 1
@@ -108,15 +190,75 @@ class CSIAnalyzer:
             features['movement_detected'] = False
 
         # Filtered amplitude (exponential moving average)
-        if len(self.amp_history) > 1:
+        if self._prev_amp_mean is not None:
             alpha = 0.3  # Smoothing factor
-            prev_amp = self.amp_history[-2]
-            features['amp_mean_filtered'] = alpha * amp_mean + (1 - alpha) * np.mean(prev_amp)
+            features['amp_mean_filtered'] = alpha * amp_mean + (1 - alpha) * self._prev_amp_mean
         else:
             features['amp_mean_filtered'] = amp_mean
+        self._prev_amp_mean = amp_mean
 
         return features
 
+    def _process_amplitudes(self, amp):
+        """
+        Amplitude statistics and windowed temporal variance for one packet
+
+        All per-packet numeric work on the amplitude vector happens here in
+        a handful of whole-array reductions. The window keeps running
+        per-subcarrier sums and a running total of squares; the sum of
+        squares behind amp_std doubles as this packet's contribution, so
+        the temporal variance costs one extra dot product per packet.
+
+        Args:
+            amp: float64 vector of subcarrier amplitudes
+
+        Returns:
+            Tuple of (mean, std, min, max, temporal_variance) as Python floats;
+            temporal_variance is None until the window is full
+        """
+        n = self.window_size
+        n_sub = amp.size
+
+        # Amplitude statistics from one sum and one sum of squares
+        amp_sumsq = float(amp.dot(amp))
+        amp_mean = float(amp.sum()) / n_sub
+        amp_std = max(amp_sumsq / n_sub - amp_mean * amp_mean, 0.0) ** 0.5
+
+        # Add to history (a change in subcarrier count restarts the window)
+        if self._ring is None or self._ring.shape[1] != n_sub:
+            self._ring = np.empty((n, n_sub))
+            self._row_sumsq = [0.0] * n
+            self._col_sum = np.zeros(n_sub)
+            self._sumsq = 0.0
+            self._head = 0
+            self._filled = 0
+
+        head = self._head
+        if self._filled == n:
+            # Drop the evicted row from the running totals
+            self._col_sum -= self._ring[head]
+            self._sumsq -= self._row_sumsq[head]
+        else:
+            self._filled += 1
+        self._ring[head] = amp
+        self._row_sumsq[head] = amp_sumsq
+        self._col_sum += amp
+        self._sumsq += amp_sumsq
+        self._head = (head + 1) % n
+
+        temporal_variance = None
+        if self._filled == n:
+            if self.packet_count % VARIANCE_RESYNC_INTERVAL == 0:
+                self._ring.sum(axis=0, out=self._col_sum)
+                self._sumsq = sum(self._row_sumsq)
+
+            # Squared deviations from each subcarrier's window mean, summed
+            # over the window and all subcarriers: sum(x^2) - sum(col_sum^2) / n
+            m2 = self._sumsq - float(self._col_sum.dot(self._col_sum)) / n
+            temporal_variance = max(m2 / (n * n_sub), 0.0)
+
+        return amp_mean, amp_std, float(amp.min()), float(amp.max()), temporal_variance
+
     def get_statistics(self):
         """Get overall statistics"""
         return {
@@ -126,6 +268,101 @@ class CSIAnalyzer:
         }
 
 
+def format_movement(now, features):
+    """Console line for --detect-movement mode"""
+    status = "🟢 MOVEMENT" if features['movement_detected'] else "⚪ STATIC"
+    return (f"[{now}] Packet #{features['packet_num']:4d} | "
+            f"RSSI={features['rssi']:3d}dBm | "
+            f"Amp: μ={features['amp_mean']:5.1f} σ={features['amp_std']:5.1f} | "
+            f"Var={features['temporal_variance']:5.2f} | {status}")
+
+
+def format_features(now, features):
+    """Console line for the default display mode"""
+    return (f"[{now}] Packet #{features['packet_num']:4d} | "
+            f"RSSI={features['rssi']:3d}dBm (avg={features['rssi_mean']:5.1f}) | "
+            f"Amp: μ={features['amp_mean']:5.1f} σ={features['amp_std']:5.1f} | "
+            f"Filtered={features['amp_mean_filtered']:5.1f}")
+
+
+def format_verbose(features):
+    """Extra console lines for --verbose"""
+    return (f"  Range: [{features['amp_min']:.1f}, {features['amp_max']:.1f}] "
+            f"span={features['amp_range']:.1f}\n"
+            f"  Temporal variance: {features['temporal_variance']:.2f}\n")
+
+
+def make_packet_handler(analyzer, format_line, verbose=False, outfile=None, raw_outfile=None,
+                        combined_outfile=None):
+    """
+    Build the per-packet handler for this session's options
+
+    Display mode and output files are fixed once the serial loop starts, so
+    they are resolved here once and the returned closure runs only the
+    steps this session needs, with no per-packet option checks.
+
+    Args:
+        analyzer: CSIAnalyzer instance
+        format_line: Console formatter (format_movement or format_features)
+        verbose: Also print format_verbose() lines
+        outfile: Binary file for processed features, or None
+        raw_outfile: Binary file for raw CSI packets, or None
+        combined_outfile: Binary file for {"raw": ..., "features": ...}
+            records, or None (not combined with outfile/raw_outfile)
+
+    Returns:
+        Function taking a parsed packet dict
+    """
+    if verbose:
+        base_format = format_line
+
+        def format_line(now, features):
+            return base_format(now, features) + '\n' + format_verbose(features)
+
+    # Wall-clock "HH:MM:SS" prefix, re-formatted only when the second changes
+    last_secs = None
+    hms = ''
+
+    def process_and_show(data):
+        nonlocal last_secs, hms
+        features = analyzer.process_packet(data)
+
+        t = time.time()
+        secs = int(t)
+        if secs != last_secs:
+            hms = time.strftime('%H:%M:%S', time.localtime(secs))
+            last_secs = secs
+        print(format_line(f"{hms}.{int((t - secs) * 1000):03d}", features))
+        return features
+
+    dumps = orjson.dumps
+    numpy_option = orjson.OPT_SERIALIZE_NUMPY
+
+    if combined_outfile:
+        # Raw packet and features serialized together in one dumps() call
+        def handle(data):
+            features = process_and_show(data)
+            combined_outfile.write(
+                dumps({'raw': data, 'features': features}, option=numpy_option) + b'\n')
+    elif outfile and raw_outfile:
+        def handle(data):
+            features = process_and_show(data)
+            outfile.write(dumps(features, option=numpy_option) + b'\n')
+            raw_outfile.write(dumps(data) + b'\n')
+    elif outfile:
+        def handle(data):
+            features = process_and_show(data)
+            outfile.write(dumps(features, option=numpy_option) + b'\n')
+    elif raw_outfile:
+        def handle(data):
+            process_and_show(data)
+            raw_outfile.write(dumps(data) + b'\n')
+    else:
+        handle = process_and_show
+
+    return handle
+
+
 def main():
     parser = argparse.ArgumentParser(description='Analyze CSI data from ESP32 with signal processing')
     parser.add_argument('port', help='Serial port (e.g., /dev/ttyUSB0, COM3)')
@@ -134,10 +371,16 @@ def main():
     parser.add_argument('-t', '--threshold', type=float, default=5.0, help='Movement detection threshold (default: 5.0)')
     parser.add_argument('-o', '--output', help='Save processed features to file (JSONL format)')
     parser.add_argument('-r', '--raw-output', help='Save raw CSI data to file (JSONL format)')
+    parser.add_argument('-c', '--combined-output',
+                        help='Save raw CSI data and features together to one file '
+                             '(JSONL, {"raw": ..., "features": ...} per packet)')
     parser.add_argument('-d', '--detect-movement', action='store_true', help='Enable movement detection alerts')
     parser.add_argument('-v', '--verbose', action='store_true', help='Show detailed output')
     args = parser.parse_args()
 
+    if args.combined_output and (args.output or args.raw_output):
+        parser.error("--combined-output replaces --output/--raw-output; use one or the other")
+
     # Initialize analyzer
     analyzer = CSIAnalyzer(window_size=args.window, movement_threshold=args.threshold)
 
@@ -159,68 +402,66 @@ def main():
     # Open output files if specified
     outfile = None
     raw_outfile = None
+    combined_outfile = None
     if args.output:
-        outfile = open(args.output, 'a')
+        outfile = open(args.output, 'ab', buffering=WRITE_BUFFER_SIZE)
         print(f"Saving processed features to {args.output}")
     if args.raw_output:
-        raw_outfile = open(args.raw_output, 'a')
+        raw_outfile = open(args.raw_output, 'ab', buffering=WRITE_BUFFER_SIZE)
         print(f"Saving raw CSI data to {args.raw_output}")
-    if outfile or raw_outfile:
+    if args.combined_output:
+        combined_outfile = open(args.combined_output, 'ab', buffering=WRITE_BUFFER_SIZE)
+        print(f"Saving raw CSI data and features to {args.combined_output}")
+    if outfile or raw_outfile or combined_outfile:
         print()
 
+    open_files = [f for f in (outfile, raw_outfile, combined_outfile) if f]
+    writes_since_flush = 0
+    last_flush = time.monotonic()
+
+    # Display mode and outputs are fixed for the session, so specialize
+    # the per-packet work once
+    format_line = format_movement if args.detect_movement else format_features
+    handle_packet = make_packet_handler(analyzer, format_line, args.verbose,
+                                        outfile, raw_outfile, combined_outfile)
+
+    # Read the serial port on a background thread so UART input keeps
+    # flowing while packets are processed and written; the queue is
+    # bounded so a stalled consumer can't grow memory without limit
+    reader = SerialLineReader(ser, max_lines=256)
+    reader.start()
+
     try:
         while True:
-            line = ser.readline().decode('utf-8', errors='ignore').strip()
+            line = reader.get_line(timeout=1)
 
             # Skip empty lines and ESP-IDF log lines
-            if not line or not line.startswith('{'):
+            if not line or line[:1] != b'{':
                 continue
 
             try:
-                # Parse JSON
-                data = json.loads(line)
+                # Parse JSON (orjson accepts bytes, no decode needed)
+                data = orjson.loads(line)
 
                 # Validate expected fields
-                if 'ts' not in data or 'rssi' not in data or 'amp' not in data:
+                if not is_csi_packet(data):
                     continue
 
-                # Process packet
-                features = analyzer.process_packet(data)
-
-                # Display
-                now = datetime.now().strftime('%H:%M:%S.%f')[:-3]
-                status = "🟢 MOVEMENT" if features.get('movement_detected', False) else "⚪ STATIC"
-
-                if args.detect_movement:
-                    print(f"[{now}] Packet #{features['packet_num']:4d} | "
-                          f"RSSI={features['rssi']:3d}dBm | "
-                          f"Amp: μ={features['amp_mean']:5.1f} σ={features['amp_std']:5.1f} | "
-                          f"Var={features.get('temporal_variance', 0):5.2f} | {status}")
-                else:
-                    print(f"[{now}] Packet #{features['packet_num']:4d} | "
-                          f"RSSI={features['rssi']:3d}dBm (avg={features['rssi_mean']:5.1f}) | "
-                          f"Amp: μ={features['amp_mean']:5.1f} σ={features['amp_std']:5.1f} | "
-                          f"Filtered={features['amp_mean_filtered']:5.1f}")
-
-                if args.verbose:
-                    print(f"  Range: [{features['amp_min']:.1f}, {features['amp_max']:.1f}] "
-                          f"span={features['amp_range']:.1f}")
-                    if 'temporal_variance' in features:
-                        print(f"  Temporal variance: {features['temporal_variance']:.2f}")
-                    print()
-
-                # Save processed features
-                if outfile:
-                    outfile.write(json.dumps(features) + '\n')
-                    outfile.flush()
-
-                # Save raw data
-                if raw_outfile:
-                    raw_outfile.write(json.dumps(data) + '\n')
-                    raw_outfile.flush()
-
-            except json.JSONDecodeError:
-                # Not valid JSON, skip
+                # Process, display and save packet
+                handle_packet(data)
+
+                # Flush in batches rather than once per packet
+                if open_files:
+                    writes_since_flush += 1
+                    now_mono = time.monotonic()
+                    if writes_since_flush >= FLUSH_EVERY or now_mono - last_flush > FLUSH_INTERVAL:
+                        for f in open_files:
+                            f.flush()
+                        writes_since_flush = 0
+                        last_flush = now_mono
+
+            except (orjson.JSONDecodeError, ValueError):
+                # Not valid JSON or malformed CSI packet, skip
                 pass
 
     except KeyboardInterrupt:
@@ -235,6 +476,8 @@ def main():
         print("Exiting...")
 
     finally:
+        # close() flushes whatever is still buffered
+        reader.stop()
         ser.close()
         if outfile:
             outfile.close()
@@ -242,6 +485,9 @@ def main():
         if raw_outfile:
             raw_outfile.close()
             print(f"Raw CSI data saved to {args.raw_output}")
+        if combined_outfile:
+            combined_outfile.close()
+            print(f"Raw CSI data and features saved to {args.combined_output}")
 
 
 if __name__ == '__main__':
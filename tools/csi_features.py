@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+CSI Feature Schema
+
+Feature vector layout shared by csi_analyzer.py, ML training and real-time
+inference, plus a fast extractor for turning feature dicts into vectors.
+
+Deliberately dependency-free (no serial/numpy imports) so offline tools
+such as ml/scripts/train_model.py can use it without the capture stack.
+
+Usage:
+    from csi_features import FEATURE_NAMES, compile_feature_extractor
+
+    extract = compile_feature_extractor(FEATURE_NAMES)
+    row = extract(features)   # tuple in FEATURE_NAMES order
+"""
+
+# Feature vector layout used for ML training and real-time inference
+FEATURE_NAMES = [
+    'rssi', 'rssi_mean', 'amp_mean', 'amp_std',
+    'amp_max', 'amp_min', 'amp_range',
+    'temporal_variance', 'amp_mean_filtered'
+]
+
+
+def compile_feature_extractor(feature_names, default=0):
+    """
+    Build a function that pulls a fixed list of features out of a dict
+
+    The function body is generated once for the given names, so each call
+    is a single straight-line tuple expression with the keys as constants.
+
+    Args:
+        feature_names: Keys to extract, in output order
+        default: Value used for missing keys
+
+    Returns:
+        Function mapping a feature dict to a tuple of values
+    """
+    values = ', '.join(f"d.get({name!r}, {default!r})" for name in feature_names)
+    source = f"def extract(d):\n    return ({values},)\n"
+    namespace = {}
+    exec(source, namespace)
+    return namespace['extract']
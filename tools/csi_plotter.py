@@ -15,8 +15,10 @@ Usage:
     python3 csi_plotter.py baseline.json movement.json --compare
 """
 
+import os
 import sys
-import json
+import mmap
+import orjson
 import argparse
 import numpy as np
 import matplotlib.pyplot as plt
@@ -24,25 +26,117 @@ from datetime import datetime
 
 
 def load_csi_data(filename):
-    """Load CSI feature data from JSONL file"""
-    data = []
-    with open(filename, 'r') as f:
-        for line in f:
-            try:
-                data.append(json.loads(line.strip()))
-            except json.JSONDecodeError:
-                continue
-    return data
+    """
+    Load CSI feature data from JSONL file
+
+    Each feature is parsed once into its own numpy column, so plotting code
+    slices arrays instead of re-walking a list of dicts per feature.
+
+    Args:
+        filename: Path to JSONL file written by csi_analyzer.py
+            (--output, or --combined-output records)
+
+    Returns:
+        Dict mapping feature name to a numpy array with one entry per packet
+        (lines that are not valid feature records are skipped)
+    """
+    # Map the file and split it into byte lines in one C-level pass;
+    # orjson parses the slices directly with no text-layer decoding
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            lines = []
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                lines = mm[:].split(b'\n')
+
+    # One slot per line; trimmed to the number of valid records at the end
+    n = len(lines)
+    timestamp = np.empty(n, dtype=np.float64)
+    rssi = np.empty(n, dtype=np.int16)
+    rssi_mean = np.empty(n, dtype=np.float32)
+    amp_mean = np.empty(n, dtype=np.float32)
+    amp_mean_filtered = np.empty(n, dtype=np.float32)
+    amp_std = np.empty(n, dtype=np.float32)
+    amp_range = np.empty(n, dtype=np.float32)
+    temporal_variance = np.empty(n, dtype=np.float32)
+    movement_detected = np.empty(n, dtype=bool)
+
+    count = 0
+    for line in lines:
+        try:
+            d = orjson.loads(line)
+            if 'features' in d:
+                # csi_analyzer.py --combined-output record
+                d = d['features']
+            timestamp[count] = d['timestamp']
+            rssi[count] = d['rssi']
+            rssi_mean[count] = d.get('rssi_mean', d['rssi'])
+            amp_mean[count] = d['amp_mean']
+            amp_mean_filtered[count] = d.get('amp_mean_filtered', d['amp_mean'])
+            amp_std[count] = d['amp_std']
+            amp_range[count] = d['amp_range']
+            temporal_variance[count] = d.get('temporal_variance', 0)
+            movement_detected[count] = d.get('movement_detected', False)
+        except (orjson.JSONDecodeError, KeyError, TypeError):
+            # Not a feature record; the slot is reused by the next line
+            continue
+        count += 1
+
+    return {
+        'timestamp': timestamp[:count],
+        'rssi': rssi[:count],
+        'rssi_mean': rssi_mean[:count],
+        'amp_mean': amp_mean[:count],
+        'amp_mean_filtered': amp_mean_filtered[:count],
+        'amp_std': amp_std[:count],
+        'amp_range': amp_range[:count],
+        'temporal_variance': temporal_variance[:count],
+        'movement_detected': movement_detected[:count],
+    }
+
+
+def decimate_minmax(t, values, n_buckets):
+    """
+    Reduce a time series to the minimum and maximum of each bucket
+
+    Keeping both extremes of every bucket preserves peaks and the visual
+    envelope of the line, while matplotlib only has to draw about two
+    points per horizontal pixel instead of every sample.
+
+    Args:
+        t: Time axis (1-D array)
+        values: Values at each time (1-D array, same length)
+        n_buckets: Number of buckets (e.g. axis width in pixels)
+
+    Returns:
+        Tuple of (t, values), unchanged if the series is already short
+    """
+    n = len(values)
+    if n <= 4 * n_buckets:
+        return t, values
+
+    # Equal-sized buckets; the remainder (< one bucket) is kept as-is
+    size = n // n_buckets
+    m = size * n_buckets
+    buckets = values[:m].reshape(n_buckets, size)
+    offsets = np.arange(0, m, size)
+    i_min = buckets.argmin(axis=1) + offsets
+    i_max = buckets.argmax(axis=1) + offsets
+
+    # Keep each bucket's two points in time order
+    idx = np.sort(np.stack([i_min, i_max], axis=1), axis=1).ravel()
+    idx = np.concatenate([idx, np.arange(m, n)])
+    return t[idx], values[idx]
 
 
 def plot_features(data, features_to_plot):
     """Plot specified features over time"""
-    if not data:
+    if len(data['timestamp']) == 0:
         print("No data to plot!")
         return
 
     # Extract timestamps (convert ms to seconds)
-    timestamps = np.array([d['timestamp'] for d in data]) / 1000.0
+    timestamps = data['timestamp'] / 1000.0
     timestamps = timestamps - timestamps[0]  # Start from 0
 
     # Number of subplots needed
@@ -52,47 +146,47 @@ def plot_features(data, features_to_plot):
     if n_plots == 1:
         axes = [axes]
 
+    # Long series are decimated to about two points per pixel of width
+    n_px = int(fig.get_figwidth() * fig.dpi)
+
+    def series(values):
+        return decimate_minmax(timestamps, values, n_px)
+
     for ax, feature in zip(axes, features_to_plot):
         if feature == 'amplitude':
-            values = [d['amp_mean'] for d in data]
-            filtered = [d.get('amp_mean_filtered', d['amp_mean']) for d in data]
-            ax.plot(timestamps, values, 'b-', alpha=0.5, label='Raw')
-            ax.plot(timestamps, filtered, 'r-', linewidth=2, label='Filtered')
+            ax.plot(*series(data['amp_mean']), 'b-', alpha=0.5, label='Raw')
+            ax.plot(*series(data['amp_mean_filtered']), 'r-', linewidth=2, label='Filtered')
             ax.set_ylabel('Amplitude (mean)')
             ax.legend()
             ax.grid(True, alpha=0.3)
 
         elif feature == 'rssi':
-            values = [d['rssi'] for d in data]
-            filtered = [d.get('rssi_mean', d['rssi']) for d in data]
-            ax.plot(timestamps, values, 'g-', alpha=0.5, label='Raw RSSI')
-            ax.plot(timestamps, filtered, 'darkgreen', linewidth=2, label='Mean RSSI')
+            ax.plot(*series(data['rssi']), 'g-', alpha=0.5, label='Raw RSSI')
+            ax.plot(*series(data['rssi_mean']), 'darkgreen', linewidth=2, label='Mean RSSI')
             ax.set_ylabel('RSSI (dBm)')
             ax.legend()
             ax.grid(True, alpha=0.3)
 
         elif feature == 'variance':
-            values = [d.get('temporal_variance', 0) for d in data]
-            ax.plot(timestamps, values, 'purple', linewidth=2)
+            values = data['temporal_variance']
+            ax.plot(*series(values), 'purple', linewidth=2)
             ax.set_ylabel('Temporal Variance')
             ax.grid(True, alpha=0.3)
 
             # Mark movement detection
-            movement = [d.get('movement_detected', False) for d in data]
-            movement_times = timestamps[np.array(movement)]
-            movement_vals = np.array(values)[np.array(movement)]
+            movement = data['movement_detected']
+            movement_times = timestamps[movement]
+            movement_vals = values[movement]
             ax.scatter(movement_times, movement_vals, color='red', s=50, label='Movement', zorder=5)
             ax.legend()
 
         elif feature == 'std':
-            values = [d['amp_std'] for d in data]
-            ax.plot(timestamps, values, 'orange', linewidth=2)
+            ax.plot(*series(data['amp_std']), 'orange', linewidth=2)
             ax.set_ylabel('Amplitude Std Dev')
             ax.grid(True, alpha=0.3)
 
         elif feature == 'range':
-            values = [d['amp_range'] for d in data]
-            ax.plot(timestamps, values, 'brown', linewidth=2)
+            ax.plot(*series(data['amp_range']), 'brown', linewidth=2)
             ax.set_ylabel('Amplitude Range')
             ax.grid(True, alpha=0.3)
 
@@ -105,27 +199,70 @@ def plot_features(data, features_to_plot):
     plt.show()
 
 
+def summarize(values, label):
+    """
+    Summary statistics for one feature column, computed once
+
+    Args:
+        values: 1-D numpy array of feature values
+        label: Box label for the comparison plot
+
+    Returns:
+        Dict with 'mean', 'std' and 'box' (box statistics in the form
+        Axes.bxp() expects, 1.5 IQR whiskers as in Axes.boxplot())
+    """
+    q1, med, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+    iqr = q3 - q1
+    inside = (values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)
+    whiskers = values[inside]
+
+    return {
+        'mean': float(values.mean(dtype=np.float64)),
+        'std': float(values.std(dtype=np.float64)),
+        'box': {
+            'label': label,
+            'med': med, 'q1': q1, 'q3': q3,
+            'whislo': whiskers.min(), 'whishi': whiskers.max(),
+            'fliers': values[~inside],
+        },
+    }
+
+
 def compare_datasets(baseline_data, movement_data):
     """Compare baseline and movement datasets"""
-    if not baseline_data or not movement_data:
+    if len(baseline_data['timestamp']) == 0 or len(movement_data['timestamp']) == 0:
         print("Need both baseline and movement data!")
         return
 
     fig, axes = plt.subplots(2, 2, figsize=(14, 10))
 
     # Extract features
-    baseline_amp = [d['amp_mean'] for d in baseline_data]
-    movement_amp = [d['amp_mean'] for d in movement_data]
-
-    baseline_var = [d.get('temporal_variance', 0) for d in baseline_data]
-    movement_var = [d.get('temporal_variance', 0) for d in movement_data]
-
-    baseline_std = [d['amp_std'] for d in baseline_data]
-    movement_std = [d['amp_std'] for d in movement_data]
+    baseline_amp = baseline_data['amp_mean']
+    movement_amp = movement_data['amp_mean']
+
+    baseline_var = baseline_data['temporal_variance']
+    movement_var = movement_data['temporal_variance']
+
+    # Summary statistics, computed once and shared by plots and printout
+    baseline_amp_stats = summarize(baseline_amp, 'Baseline')
+    movement_amp_stats = summarize(movement_amp, 'Movement')
+    baseline_var_stats = summarize(baseline_var, 'Baseline')
+    movement_var_stats = summarize(movement_var, 'Movement')
+    baseline_std_stats = summarize(baseline_data['amp_std'], 'Baseline')
+    movement_std_stats = summarize(movement_data['amp_std'], 'Movement')
+
+    # Both histograms of a feature share one set of bin edges; counts are
+    # binned with np.histogram and drawn as bars
+    amp_bins = np.histogram_bin_edges(np.concatenate([baseline_amp, movement_amp]), bins=30)
+    var_bins = np.histogram_bin_edges(np.concatenate([baseline_var, movement_var]), bins=30)
+    amp_widths = np.diff(amp_bins)
+    var_widths = np.diff(var_bins)
 
     # Plot 1: Amplitude comparison
-    axes[0,0].hist(baseline_amp, bins=30, alpha=0.5, label='Baseline', color='blue')
-    axes[0,0].hist(movement_amp, bins=30, alpha=0.5, label='Movement', color='red')
+    axes[0,0].bar(amp_bins[:-1], np.histogram(baseline_amp, amp_bins)[0], width=amp_widths,
+                  align='edge', alpha=0.5, label='Baseline', color='blue')
+    axes[0,0].bar(amp_bins[:-1], np.histogram(movement_amp, amp_bins)[0], width=amp_widths,
+                  align='edge', alpha=0.5, label='Movement', color='red')
     axes[0,0].set_xlabel('Amplitude Mean')
     axes[0,0].set_ylabel('Frequency')
     axes[0,0].set_title('Amplitude Distribution')
@@ -133,22 +270,24 @@ def compare_datasets(baseline_data, movement_data):
     axes[0,0].grid(True, alpha=0.3)
 
     # Plot 2: Temporal variance comparison
-    axes[0,1].hist(baseline_var, bins=30, alpha=0.5, label='Baseline', color='blue')
-    axes[0,1].hist(movement_var, bins=30, alpha=0.5, label='Movement', color='red')
+    axes[0,1].bar(var_bins[:-1], np.histogram(baseline_var, var_bins)[0], width=var_widths,
+                  align='edge', alpha=0.5, label='Baseline', color='blue')
+    axes[0,1].bar(var_bins[:-1], np.histogram(movement_var, var_bins)[0], width=var_widths,
+                  align='edge', alpha=0.5, label='Movement', color='red')
     axes[0,1].set_xlabel('Temporal Variance')
     axes[0,1].set_ylabel('Frequency')
     axes[0,1].set_title('Temporal Variance Distribution')
     axes[0,1].legend()
     axes[0,1].grid(True, alpha=0.3)
 
-    # Plot 3: Amplitude std comparison
-    axes[1,0].boxplot([baseline_amp, movement_amp], labels=['Baseline', 'Movement'])
+    # Plot 3: Amplitude std comparison (boxes drawn from precomputed stats)
+    axes[1,0].bxp([baseline_amp_stats['box'], movement_amp_stats['box']])
     axes[1,0].set_ylabel('Amplitude Mean')
     axes[1,0].set_title('Amplitude Statistics')
     axes[1,0].grid(True, alpha=0.3)
 
     # Plot 4: Variance boxplot
-    axes[1,1].boxplot([baseline_var, movement_var], labels=['Baseline', 'Movement'])
+    axes[1,1].bxp([baseline_var_stats['box'], movement_var_stats['box']])
     axes[1,1].set_ylabel('Temporal Variance')
     axes[1,1].set_title('Variance Statistics')
     axes[1,1].grid(True, alpha=0.3)
@@ -159,20 +298,22 @@ def compare_datasets(baseline_data, movement_data):
     # Print statistics
     print("\n" + "="*60)
     print("BASELINE STATISTICS:")
-    print(f"  Amplitude:  μ={np.mean(baseline_amp):.2f}, σ={np.std(baseline_amp):.2f}")
-    print(f"  Variance:   μ={np.mean(baseline_var):.2f}, σ={np.std(baseline_var):.2f}")
-    print(f"  Std Dev:    μ={np.mean(baseline_std):.2f}, σ={np.std(baseline_std):.2f}")
+    print(f"  Amplitude:  μ={baseline_amp_stats['mean']:.2f}, σ={baseline_amp_stats['std']:.2f}")
+    print(f"  Variance:   μ={baseline_var_stats['mean']:.2f}, σ={baseline_var_stats['std']:.2f}")
+    print(f"  Std Dev:    μ={baseline_std_stats['mean']:.2f}, σ={baseline_std_stats['std']:.2f}")
 
     print("\nMOVEMENT STATISTICS:")
-    print(f"  Amplitude:  μ={np.mean(movement_amp):.2f}, σ={np.std(movement_amp):.2f}")
-    print(f"  Variance:   μ={np.mean(movement_var):.2f}, σ={np.std(movement_var):.2f}")
-    print(f"  Std Dev:    μ={np.mean(movement_std):.2f}, σ={np.std(movement_std):.2f}")
+    print(f"  Amplitude:  μ={movement_amp_stats['mean']:.2f}, σ={movement_amp_stats['std']:.2f}")
+    print(f"  Variance:   μ={movement_var_stats['mean']:.2f}, σ={movement_var_stats['std']:.2f}")
+    print(f"  Std Dev:    μ={movement_std_stats['mean']:.2f}, σ={movement_std_stats['std']:.2f}")
 
+    amp_diff = movement_amp_stats['mean'] - baseline_amp_stats['mean']
+    var_diff = movement_var_stats['mean'] - baseline_var_stats['mean']
     print("\nDIFFERENCES:")
-    print(f"  Amplitude:  Δμ={np.mean(movement_amp) - np.mean(baseline_amp):.2f} "
-          f"({(np.mean(movement_amp) - np.mean(baseline_amp)) / np.mean(baseline_amp) * 100:+.1f}%)")
-    print(f"  Variance:   Δμ={np.mean(movement_var) - np.mean(baseline_var):.2f} "
-          f"({(np.mean(movement_var) - np.mean(baseline_var)) / max(np.mean(baseline_var), 0.001) * 100:+.1f}%)")
+    print(f"  Amplitude:  Δμ={amp_diff:.2f} "
+          f"({amp_diff / baseline_amp_stats['mean'] * 100:+.1f}%)")
+    print(f"  Variance:   Δμ={var_diff:.2f} "
+          f"({var_diff / max(baseline_var_stats['mean'], 0.001) * 100:+.1f}%)")
     print("="*60 + "\n")
 
     plt.show()
@@ -205,11 +346,11 @@ def main():
 
         print(f"Loading baseline: {args.input[0]}")
         baseline_data = load_csi_data(args.input[0])
-        print(f"  {len(baseline_data)} packets")
+        print(f"  {len(baseline_data['timestamp'])} packets")
 
         print(f"Loading movement: {args.input[1]}")
         movement_data = load_csi_data(args.input[1])
-        print(f"  {len(movement_data)} packets")
+        print(f"  {len(movement_data['timestamp'])} packets")
 
         compare_datasets(baseline_data, movement_data)
 
@@ -220,9 +361,9 @@ def main():
 
         print(f"Loading data: {args.input[0]}")
         data = load_csi_data(args.input[0])
-        print(f"  {len(data)} packets")
+        print(f"  {len(data['timestamp'])} packets")
 
-        if len(data) == 0:
+        if len(data['timestamp']) == 0:
             print("Error: No data found in file")
             sys.exit(1)
 
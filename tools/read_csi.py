@@ -15,6 +15,8 @@ import serial
 import argparse
 from datetime import datetime
 
+from csi_analyzer import is_csi_packet, decode_amplitudes
+
 
 def main():
     parser = argparse.ArgumentParser(description='Read CSI data from ESP32')
@@ -56,17 +58,18 @@ def main():
                 data = json.loads(line)
 
                 # Validate expected fields
-                if 'ts' not in data or 'rssi' not in data or 'amp' not in data:
+                if not is_csi_packet(data):
                     continue
 
+                amp = decode_amplitudes(data)
                 packet_count += 1
 
                 # Display summary
                 ts = data['ts']
                 rssi = data['rssi']
-                num = data.get('num', len(data['amp']))
-                amp_mean = sum(data['amp']) / len(data['amp'])
-                amp_max = max(data['amp'])
+                num = data.get('num', len(amp))
+                amp_mean = amp.mean()
+                amp_max = amp.max()
 
                 now = datetime.now().strftime('%H:%M:%S.%f')[:-3]
                 print(f"[{now}] Packet #{packet_count:4d} | "
@@ -76,7 +79,7 @@ def main():
 
                 # Show full data if verbose
                 if args.verbose:
-                    print(f"  Amplitude: {data['amp'][:10]}...")
+                    print(f"  Amplitude: {amp[:10].round(2).tolist()}...")
                     if 'phase' in data:
                         print(f"  Phase:     {data['phase'][:10]}...")
                     print()
@@ -86,8 +89,8 @@ def main():
                     outfile.write(json.dumps(data) + '\n')
                     outfile.flush()
 
-            except json.JSONDecodeError:
-                # Not valid JSON, skip
+            except (json.JSONDecodeError, ValueError):
+                # Not valid JSON or malformed CSI packet, skip
                 pass
 
     except KeyboardInterrupt:
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Background Serial Line Reader
+
+Reads the ESP32 serial stream on a background thread and hands complete
+lines to the main thread through a queue. UART reads then overlap with
+JSON parsing, feature extraction and model inference instead of waiting
+behind them, so a slow packet no longer stalls the serial port.
+
+On POSIX the port is polled for readiness (epoll on Linux) and drained in
+bulk with os.read; other platforms use pyserial's blocking read.
+
+Usage:
+    ser = serial.Serial('/dev/ttyUSB0', 115200, timeout=1)
+    reader = SerialLineReader(ser)
+    reader.start()
+
+    line = reader.get_line(timeout=1)   # bytes, or None on timeout
+
+    reader.stop()
+    ser.close()
+"""
+
+import os
+import queue
+import selectors
+import threading
+
+import serial
+
+
+class SerialLineReader:
+    """Background thread that splits a serial stream into lines"""
+
+    def __init__(self, ser, chunk_size=4096, max_lines=0, rx_buffer_size=131072,
+                 poll_interval=0.1):
+        """
+        Initialize line reader
+
+        Args:
+            ser: Open serial.Serial port (a read timeout should be set)
+            chunk_size: Maximum bytes requested per read
+            max_lines: Queue capacity in lines (0 = unbounded)
+            rx_buffer_size: Driver receive buffer size, where supported
+            poll_interval: Seconds between stop checks while the port is idle
+        """
+        self.ser = ser
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.error = None
+
+        self._lines = queue.Queue(maxsize=max_lines)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        # Only some platforms (Windows) let us resize the driver buffer
+        if hasattr(ser, 'set_buffer_size'):
+            ser.set_buffer_size(rx_size=rx_buffer_size)
+
+    def start(self):
+        """Start the reader thread"""
+        self._thread = threading.Thread(target=self._run, name='serial-reader', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        """Stop the reader thread and wait for it to exit"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def get_line(self, timeout=None):
+        """
+        Get the next complete line
+
+        Args:
+            timeout: Seconds to wait for a line (None = wait forever)
+
+        Returns:
+            Line as bytes with surrounding whitespace stripped,
+            or None if no line arrived within the timeout
+
+        Raises:
+            serial.SerialException: The reader thread lost the port
+        """
+        try:
+            return self._lines.get(timeout=timeout)
+        except queue.Empty:
+            if self.error is not None:
+                raise self.error
+            return None
+
+    def _run(self):
+        """Read chunks and split them on newlines until stopped"""
+        fd = getattr(self.ser, 'fd', None)
+        if fd is None:
+            # No file descriptor (e.g. Windows): pyserial's blocking read,
+            # taking everything already received or waiting for one byte
+            self._read_lines(
+                lambda: self.ser.read(min(self.ser.in_waiting, self.chunk_size) or 1))
+            return
+
+        # POSIX: wait for readiness (epoll on Linux) and drain whatever
+        # arrived with one os.read, instead of blocking inside read()
+        with selectors.DefaultSelector() as selector:
+            selector.register(fd, selectors.EVENT_READ)
+
+            def read_chunk():
+                if not selector.select(timeout=self.poll_interval):
+                    return b''
+                try:
+                    chunk = os.read(fd, self.chunk_size)
+                except BlockingIOError:
+                    return b''
+                if not chunk:
+                    raise serial.SerialException('device disconnected')
+                return chunk
+
+            self._read_lines(read_chunk)
+
+    def _put(self, line):
+        """
+        Queue a line, waiting while the queue is full
+
+        Waits in poll_interval steps so a stop request is still noticed
+        when the consumer has fallen behind and a bounded queue is full.
+
+        Returns:
+            True if queued, False if the reader was stopped first
+        """
+        while not self._stop_event.is_set():
+            try:
+                self._lines.put(line, timeout=self.poll_interval)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read_lines(self, read_chunk):
+        """Split chunks returned by read_chunk() into queued lines"""
+        buf = bytearray()
+
+        while not self._stop_event.is_set():
+            try:
+                chunk = read_chunk()
+            except (serial.SerialException, OSError) as e:
+                self.error = e
+                return
+
+            if not chunk:
+                continue
+            buf += chunk
+
+            start = 0
+            while True:
+                end = buf.find(b'\n', start)
+                if end < 0:
+                    break
+                if not self._put(bytes(buf[start:end]).strip()):
+                    return
+                start = end + 1
+            del buf[:start]